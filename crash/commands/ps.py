@@ -418,7 +418,7 @@ Search for task names matching a POSIX regular expression:
         20      2   3  ffff8802129a9710  IN   0.0      0      0  [migration/3]
 """
 
-from typing import Pattern, Optional, Callable, Dict
+from typing import Pattern, Optional, Callable, Dict, List, Tuple
 
 import argparse
 import fnmatch
@@ -607,14 +607,16 @@ class PSCommand(Command):
         Command.__init__(self, "ps", parser)
 
         self.task_states: Dict[int, str] = dict()
+        # task_states ordered by descending bits, as they are tested
+        self._task_states_sorted: List[Tuple[int, str]] = list()
 
     def task_state_string(self, task: LinuxTask) -> str:
         state = task.task_state()
         buf = ""
 
-        for bits in sorted(self.task_states.keys(), reverse=True):
+        for (bits, name) in self._task_states_sorted:
             if (state & bits) == bits:
-                buf = self.task_states[bits]
+                buf = name
                 break
         if state & TF.TASK_DEAD and task.maybe_dead():
             buf = self.task_states[TF.TASK_DEAD]
@@ -642,6 +644,9 @@ class PSCommand(Command):
         if TF.has_flag('TASK_IDLE'):
             self.task_states[TF.TASK_IDLE] = "ID"
 
+        self._task_states_sorted = sorted(self.task_states.items(),
+                                          reverse=True)
+
     def execute(self, args: argparse.Namespace) -> None:
         # Unimplemented
         if args.p or args.c or args.t or args.a or args.g or args.r:
@@ -102,7 +102,12 @@ class TargetBase(gdb.LinuxKernelTarget, metaclass=abc.ABCMeta):
             task_address = thread.ptid[2]
 
             task = get_typed_pointer(task_address, task_struct_p_type)
-            ltask = LinuxTask(task.dereference())
+            # pylint: disable=protected-access
+            if LinuxTask._valid:
+                ltask = LinuxTask._from_trusted(task.dereference(),
+                                                task_address)
+            else:
+                ltask = LinuxTask(task.dereference())
 
             active = task_address in rqscurrs
             if active:
@@ -115,7 +120,7 @@ class TargetBase(gdb.LinuxKernelTarget, metaclass=abc.ABCMeta):
                 self.crashing_thread = thread
 
             self.arch_setup_thread(thread)
-            ltask.attach_thread(thread)
+            ltask._attach_thread_fast(thread)
 
             crash.cache.tasks.cache_task(ltask)
 
@@ -5,9 +5,10 @@ from typing import Iterable
 
 import gdb
 
-from crash.util import container_of
+from crash.util import offsetof
 from crash.types.list import list_for_each_entry
-from crash.exceptions import CorruptedError, InvalidArgumentError
+from crash.exceptions import ArgumentTypeError, CorruptedError
+from crash.exceptions import InvalidArgumentError
 from crash.util.symbols import Types
 
 types = Types(['struct klist_node', 'struct klist'])
@@ -57,7 +58,15 @@ def klist_for_each_entry(klist: gdb.Value, gdbtype: gdb.Type,
         :obj:`gdb.Value`: The next node in the list.  The value is of the
         specified type.
     """
+    if not isinstance(gdbtype, gdb.Type):
+        raise ArgumentTypeError('gdbtype', gdbtype, gdb.Type)
+
+    # Same as container_of, with the offset and type resolved once
+    offset = offsetof(gdbtype, member)
+    gdbtype_p = gdbtype.pointer()
+
     for node in klist_for_each(klist):
         if node.type is not types.klist_node_type:
             types.override('struct klist_node', node.type)
-        yield container_of(node, gdbtype, member)
+        addr = int(node.address) - offset
+        yield gdb.Value(addr).cast(gdbtype_p).dereference()
@@ -5,7 +5,7 @@ from typing import Iterator, Set
 
 import gdb
 
-from crash.util import container_of
+from crash.util import offsetof
 from crash.util.symbols import Types
 from crash.exceptions import ArgumentTypeError, UnexpectedGDBTypeError
 
@@ -172,12 +172,20 @@ def list_for_each_entry(list_head: gdb.Value, gdbtype: gdb.Type,
         :obj:`BufferError`: portions of the list cannot be read
         :obj:`gdb.NotAvailableError`: The target value is not available.
     """
+    if not isinstance(gdbtype, gdb.Type):
+        raise ArgumentTypeError('gdbtype', gdbtype, gdb.Type)
+
+    # Same as container_of, with the offset and type resolved once
+    # for the whole list
+    offset = offsetof(gdbtype, member)
+    gdbtype_p = gdbtype.pointer()
 
     for node in list_for_each(list_head, include_head=include_head,
                               reverse=reverse,
                               print_broken_links=print_broken_links,
                               exact_cycles=exact_cycles):
-        yield container_of(node, gdbtype, member)
+        addr = int(node.address) - offset
+        yield gdb.Value(addr).cast(gdbtype_p).dereference()
 
 def list_empty(list_head: gdb.Value) -> bool:
     """
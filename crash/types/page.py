@@ -34,6 +34,7 @@ class Page:
     pageflags: Dict[str, int] = dict()
 
     PG_tail = -1
+    PG_head = -1
     PG_slab = -1
     PG_lru = -1
 
@@ -111,6 +112,8 @@ class Page:
 
         cls.PG_slab = 1 << cls.pageflags['PG_slab']
         cls.PG_lru = 1 << cls.pageflags['PG_lru']
+        if 'PG_head' in cls.pageflags:
+            cls.PG_head = 1 << cls.pageflags['PG_head']
 
     @classmethod
     def setup_vmemmap_base(cls, symbol: gdb.Symbol) -> None:
@@ -156,7 +159,7 @@ class Page:
         cls._is_tail = cls.__is_tail_compound_head_bit
         cls._compound_head = cls.__compound_head_uses_low_bit
 
-        if 'PG_tail' in cls.pageflags.keys():
+        if 'PG_tail' in cls.pageflags:
             cls.PG_tail = 1 << cls.pageflags['PG_tail']
             cls._is_tail = cls.__is_tail_flag
 
@@ -194,6 +197,12 @@ class Page:
     def is_tail(self) -> bool:
         return self._is_tail()
 
+    def is_head(self) -> bool:
+        # Kernels without PG_head don't mark compound heads we can rely on
+        if self.PG_head == -1:
+            return False
+        return bool(self.flags & self.PG_head)
+
     def is_slab(self) -> bool:
         return bool(self.flags & self.PG_slab)
 
@@ -5,7 +5,7 @@ from typing import Optional, Iterable
 
 import gdb
 
-from crash.util import container_of
+from crash.util import offsetof
 from crash.util.symbols import Types
 from crash.exceptions import ArgumentTypeError, UnexpectedGDBTypeError
 
@@ -100,5 +100,13 @@ def rbtree_postorder_for_each_entry(root: gdb.Value,
     Raises:
         :obj:`.CorruptTreeError`: the list is corrupted
     """
+    if not isinstance(gdbtype, gdb.Type):
+        raise ArgumentTypeError('gdbtype', gdbtype, gdb.Type)
+
+    # Same as container_of, with the offset and type resolved once
+    offset = offsetof(gdbtype, member)
+    gdbtype_p = gdbtype.pointer()
+
     for node in rbtree_postorder_for_each(root):
-        yield container_of(node, gdbtype, member)
+        addr = int(node.address) - offset
+        yield gdb.Value(addr).cast(gdbtype_p).dereference()
@@ -2,9 +2,10 @@
 # vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
 
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 
 from typing import TypeVar, Union, Tuple, Iterable, Dict, Optional, Set, List,\
-                   cast
+                   FrozenSet, cast
 from typing import ValuesView
 
 import sys
@@ -13,7 +14,8 @@ import traceback
 import gdb
 
 from crash.util import container_of, find_member_variant,\
-                       safe_find_member_variant
+                       safe_find_member_variant, StructReader,\
+                       InvalidComponentError, read_uint_array, offsetof
 from crash.util.symbols import Types, TypeCallbacks, SymbolCallbacks
 from crash.types.percpu import get_percpu_var
 from crash.types.list import list_for_each, list_for_each_entry, ListError
@@ -36,11 +38,15 @@ def print_flags(val: int, names: Dict[str, int]) -> str:
         ret += ")"
     return ret
 
+COL_ERROR = "\033[1;31;40m "
+COL_BOLD = "\033[1;37;40m "
+COL_END = "\033[0;37;40m "
+
 def col_error(msg: str) -> str:
-    return f"\033[1;31;40m {msg}\033[0;37;40m "
+    return COL_ERROR + msg + COL_END
 
 def col_bold(msg: str) -> str:
-    return f"\033[1;37;40m {msg}\033[0;37;40m "
+    return COL_BOLD + msg + COL_END
 
 # TODO: put to separate type
 def atomic_long_read(val: gdb.Value) -> int:
@@ -48,6 +54,54 @@ def atomic_long_read(val: gdb.Value) -> int:
 
 types = Types(['kmem_cache', 'struct kmem_cache', 'struct page', 'void *'])
 
+# Page wrappers for recently used pfns.  Checking a cache resolves the page
+# of every object, and objects of the same slab share pages, so this saves
+# constructing the same wrappers over and over.  The kernel memory doesn't
+# change while we examine it so the entries never need invalidation.
+PAGE_POOL_SIZE = 8192
+_page_pool: 'OrderedDict[int, Page]' = OrderedDict()
+
+# Both caches are keyed by the page frame containing the address, which
+# is all that's needed to tell the pages apart
+def _page_key(addr: int) -> int:
+    return addr >> Page.PAGE_SHIFT
+
+def _pooled_page_from_addr(addr: int) -> Page:
+    key = _page_key(addr)
+    page = _page_pool.get(key)
+    if page is not None:
+        _page_pool.move_to_end(key)
+        return page
+
+    page = page_from_addr(addr)
+    _page_pool[key] = page
+    if len(_page_pool) > PAGE_POOL_SIZE:
+        _page_pool.popitem(last=False)
+    return page
+
+# Compound head pages by pfn, only kept for the duration of a check_all
+# pass.  Other lookups go through the bounded page pool alone.
+_compound_cache: Optional[Dict[int, Page]] = None
+
+def _start_compound_cache() -> None:
+    global _compound_cache # pylint: disable=global-statement
+    _compound_cache = dict()
+
+def _stop_compound_cache() -> None:
+    global _compound_cache # pylint: disable=global-statement
+    _compound_cache = None
+
+def _compound_page_from_addr(addr: int) -> Page:
+    if _compound_cache is None:
+        return _pooled_page_from_addr(addr).compound_head()
+
+    key = _page_key(addr)
+    head = _compound_cache.get(key)
+    if head is None:
+        head = _pooled_page_from_addr(addr).compound_head()
+        _compound_cache[key] = head
+    return head
+
 SlabType = TypeVar('SlabType', bound='Slab')
 KmemCacheType = TypeVar('KmemCacheType', bound='KmemCache')
 
@@ -83,9 +137,9 @@ class Slab(ABC):
         self.gdb_obj = gdb_obj
         self.address = int(gdb_obj.address)
         self.kmem_cache = kmem_cache
-        self.free: Set[int] = set()
 
         self._free_populated = False
+        self._err_prefix_str: Optional[str] = None
         self.error = False
         self._misplaced_error = ""
 
@@ -190,9 +244,15 @@ class Slab(ABC):
         self._do_populate_free()
         self._free_populated = True
 
+    def _err_prefix(self) -> str:
+        # Only built once a slab actually reports an error
+        if self._err_prefix_str is None:
+            self._err_prefix_str = (f"cache {self.kmem_cache.name} slab "
+                                    f"0x{self.address:x}")
+        return self._err_prefix_str
+
     def _pr_err(self, msg: str) -> None:
-        msg = col_error(f"cache {self.kmem_cache.name} slab "
-                        f"0x{self.address:x}{msg}")
+        msg = col_error(self._err_prefix() + msg)
         self.error = True
         print(msg)
 
@@ -202,6 +262,10 @@ class SlabSLAB(Slab):
     page_slab: bool = False
     bufctl_type: gdb.Type
     real_slab_type: gdb.Type
+    _real_slab_ptr_type: gdb.Type
+    slab_list_offset: int
+    # Reads (inuse, s_mem) from the slab header in a single memory access
+    _header_reader: Optional[StructReader] = None
 
     slab_partial = 0
     slab_full = 1
@@ -228,31 +292,59 @@ class SlabSLAB(Slab):
 
         self.misplaced_list = None
         self.misplaced_error = None
+        # Bit n is set when the object in slot n is free
+        self.free_mask = 0
 
         if error:
             return
 
+        # Copied from the cache since the object loops use them heavily
         self.nr_objects = kmem_cache.objs_per_slab
-        if self.page_slab:
+        self.bufsize = kmem_cache.buffer_size
+        if self._header_reader is not None:
+            (self.nr_inuse, self.s_mem) = \
+                self._header_reader.read(self.address)
+        elif self.page_slab:
             self.nr_inuse = int(gdb_obj["active"])
-            self.page = page_from_gdb_obj(gdb_obj)
+            self.s_mem = int(gdb_obj["s_mem"])
         else:
             self.nr_inuse = int(gdb_obj["inuse"])
+            self.s_mem = int(gdb_obj["s_mem"])
+        if self.page_slab:
+            self.page = page_from_gdb_obj(gdb_obj)
         self.nr_free = self.nr_objects - self.nr_inuse
-        self.s_mem = int(gdb_obj["s_mem"])
+
+    @classmethod
+    def _setup_header_reader(cls, gdbtype: gdb.Type, inuse_name: str) -> None:
+        try:
+            cls._header_reader = StructReader(gdbtype, [inuse_name, 's_mem'])
+        except (InvalidComponentError, TypeError):
+            # Fall back to reading the fields individually
+            cls._header_reader = None
+
+    @classmethod
+    def _setup_slab_type(cls, gdbtype: gdb.Type, list_head_name: str) -> None:
+        cls.real_slab_type = gdbtype
+        cls._real_slab_ptr_type = gdbtype.pointer()
+        cls.slab_list_head = list_head_name
+        # The list_head may live in an anonymous union, so let offsetof
+        # find it rather than indexing the type directly
+        cls.slab_list_offset = offsetof(gdbtype, list_head_name)
 
     @classmethod
     def check_page_type(cls, gdbtype: gdb.Type) -> None:
         if cls.page_slab is False:
             cls.page_slab = True
-            cls.real_slab_type = gdbtype
-            cls.slab_list_head = 'lru'
+            cls._setup_slab_type(gdbtype, 'lru')
+            cls._setup_header_reader(gdbtype, 'active')
+            cls._do_populate_free = cls._populate_free_freelist
 
     @classmethod
     def check_slab_type(cls, gdbtype: gdb.Type) -> None:
         cls.page_slab = False
-        cls.real_slab_type = gdbtype
-        cls.slab_list_head = 'list'
+        cls._setup_slab_type(gdbtype, 'list')
+        cls._setup_header_reader(gdbtype, 'inuse')
+        cls._do_populate_free = cls._populate_free_bufctl
 
     @classmethod
     def check_bufctl_type(cls, gdbtype: gdb.Type) -> None:
@@ -262,16 +354,21 @@ class SlabSLAB(Slab):
     def from_addr(cls, slab_addr: int,
                   kmem_cache: Union[int, 'KmemCacheSLAB']) -> 'SlabSLAB':
         if not isinstance(kmem_cache, KmemCacheSLAB):
-            kmem_cache = cast(KmemCacheSLAB, kmem_cache_from_addr(kmem_cache))
-        slab_struct = gdb.Value(slab_addr).cast(cls.real_slab_type.pointer()).dereference()
+            cache = _kmem_cache_lookup(kmem_cache)
+            if cache is None:
+                raise KmemCacheNotFound(f"No kmem cache found for {kmem_cache}.")
+            kmem_cache = cast(KmemCacheSLAB, cache)
+        slab_struct = gdb.Value(slab_addr).cast(cls._real_slab_ptr_type).dereference()
         return cls(slab_struct, kmem_cache)
 
     @classmethod
     def from_page(cls, page: Page) -> 'SlabSLAB':
         kmem_cache_addr = int(page.get_slab_cache())
-        kmem_cache = cast(KmemCacheSLAB, kmem_cache_from_addr(kmem_cache_addr))
-        if kmem_cache is None:
-            raise RuntimeError("No kmem cache found for page")
+        cache = _kmem_cache_lookup(kmem_cache_addr)
+        if cache is None:
+            raise KmemCacheNotFound(f"No kmem cache found for page "
+                                    f"0x{page.address:x}")
+        kmem_cache = cast(KmemCacheSLAB, cache)
         if cls.page_slab:
             return cls(page.gdb_obj, kmem_cache)
         slab_addr = int(page.get_slab_page())
@@ -280,8 +377,21 @@ class SlabSLAB(Slab):
     @classmethod
     def from_list_head(cls, list_head: gdb.Value,
                        kmem_cache: 'KmemCache') -> 'SlabSLAB':
-        gdb_obj = container_of(list_head, cls.real_slab_type, cls.slab_list_head)
+        if list_head.type.code == gdb.TYPE_CODE_PTR:
+            addr = int(list_head)
+        else:
+            addr = int(list_head.address)
         kmem_cache = cast(KmemCacheSLAB, kmem_cache)
+        return cls.from_list_head_addr(addr, kmem_cache)
+
+    @classmethod
+    def from_list_head_addr(cls, addr: int,
+                            kmem_cache: 'KmemCacheSLAB') -> 'SlabSLAB':
+        """
+        Create Slab object wrapper from the address of its list_head
+        """
+        slab_addr = addr - cls.slab_list_offset
+        gdb_obj = gdb.Value(slab_addr).cast(cls._real_slab_ptr_type).dereference()
         return cls(gdb_obj, kmem_cache)
 
     def short_header(self) -> str:
@@ -296,87 +406,156 @@ class SlabSLAB(Slab):
 
     # pylint: disable=arguments-differ
     def _pr_err(self, msg: str, misplaced: bool = False) -> None:
-        msg = col_error(f"cache {self.kmem_cache.name} slab "
-                        f"0x{self.address:x}{msg}")
+        msg = col_error(self._err_prefix() + msg)
         self.error = True
         if misplaced:
             self.misplaced_error = msg
         else:
             print(msg)
 
-    def __add_free_obj_by_idx(self, idx: int) -> bool:
-        bufsize = self.kmem_cache.buffer_size
+    @property
+    def free(self) -> Set[int]:
+        """
+        The addresses of the free objects in the slab, derived from
+        :attr:`free_mask`.
+        """
+        s_mem = self.s_mem
+        bufsize = self.bufsize
+        mask = self.free_mask
+        return {s_mem + idx * bufsize for idx in range(self.nr_objects)
+                if (mask >> idx) & 1}
 
+    def __report_bad_free_idx(self, idx: int) -> None:
         if idx >= self.nr_objects:
             self._pr_err(f": free object index {idx} overflows {self.nr_objects}")
-            return False
-
-        obj_addr = self.s_mem + idx * bufsize
-        if obj_addr in self.free:
+        else:
+            obj_addr = self.s_mem + idx * self.bufsize
             self._pr_err(f": object 0x{obj_addr:x} duplicated on freelist")
-            return False
 
-        self.free.add(obj_addr)
-        return True
+    # The slab layout is fixed for a given kernel, so check_page_type and
+    # check_slab_type bind _do_populate_free to the matching variant below
+    # instead of testing page_slab for every slab.  Both the freelist and
+    # the bufctl array are contiguous arrays of object indices, which are
+    # read at once rather than index by index.
+
+    def _populate_free_freelist(self) -> None:
+        nr_objects = self.nr_objects
+        nr_inuse = self.nr_inuse
+        idx_size = self.bufctl_type.sizeof
+        mask = 0
+
+        freelist = read_uint_array(int(self.gdb_obj["freelist"]) + nr_inuse * idx_size,
+                                   nr_objects - nr_inuse, idx_size)
+        for obj_idx in freelist:
+            if obj_idx >= nr_objects or (mask >> obj_idx) & 1:
+                self.__report_bad_free_idx(obj_idx)
+                continue
+            mask |= 1 << obj_idx
 
-    def _do_populate_free(self) -> None:
-        if self.page_slab:
-            page = self.gdb_obj
-            freelist = page["freelist"].cast(self.bufctl_type.pointer())
-            for i in range(self.nr_inuse, self.nr_objects):
-                obj_idx = int(freelist[i])
-                self.__add_free_obj_by_idx(obj_idx)
-            # XXX not generally useful and reliable
-            if False and self.nr_objects > 1:
-                all_zeroes = True
-                for i in range(self.nr_objects):
-                    obj_idx = int(freelist[i])
-                    if obj_idx != 0:
-                        all_zeroes = False
-                if all_zeroes:
-                    self._pr_err(": freelist full of zeroes")
+        self.free_mask = mask
 
-        else:
-            bufctl = self.gdb_obj.address[1].cast(self.bufctl_type).address
-            f = int(self.gdb_obj["free"])
-            while f != self.BUFCTL_END:
-                if not self.__add_free_obj_by_idx(f):
-                    self._pr_err(": bufctl cycle detected")
-                    break
+    def _populate_free_bufctl(self) -> None:
+        nr_objects = self.nr_objects
+        bufctl_end = self.BUFCTL_END
+        mask = 0
+
+        # The bufctl array immediately follows struct slab
+        bufctl = read_uint_array(self.address + self.real_slab_type.sizeof,
+                                 nr_objects, self.bufctl_type.sizeof)
+        f = int(self.gdb_obj["free"])
+        if self._bufctl_has_cycle(bufctl, f):
+            self._pr_err(": bufctl cycle detected")
+            return
+
+        while f != bufctl_end:
+            if f >= nr_objects:
+                self.__report_bad_free_idx(f)
+                break
+            mask |= 1 << f
+
+            f = bufctl[f]
+
+        self.free_mask = mask
+
+    _do_populate_free = _populate_free_bufctl
+
+    def is_free(self, addr: int) -> bool:
+        """
+        Returns whether the object at the given address is on the slab's
+        freelist.  The free objects must have been populated.
+        """
+        off = addr - self.s_mem
+        if off < 0:
+            return False
+        (idx, rem) = divmod(off, self.bufsize)
+        return rem == 0 and bool((self.free_mask >> idx) & 1)
+
+    @classmethod
+    def _bufctl_has_cycle(cls, bufctl: Tuple[int, ...], start: int) -> bool:
+        """
+        Detects a cycle in the bufctl chain using Brent's algorithm, which
+        needs constant space and at most a few passes over the chain.  An
+        index outside the array terminates the chain like BUFCTL_END.
+        """
+        bufctl_end = cls.BUFCTL_END
+        nr_entries = len(bufctl)
+
+        if start == bufctl_end or start >= nr_entries:
+            return False
 
-                f = int(bufctl[f])
+        power = lam = 1
+        tortoise = start
+        hare = bufctl[start]
+        while tortoise != hare:
+            if hare == bufctl_end or hare >= nr_entries:
+                return False
+            if power == lam:
+                tortoise = hare
+                power *= 2
+                lam = 0
+            hare = bufctl[hare]
+            lam += 1
+        return True
 
     def find_obj(self, addr: int) -> Optional[int]:
 
-        bufsize = self.kmem_cache.buffer_size
+        addr = int(addr)
+        s_mem = self.s_mem
 
-        if int(addr) < self.s_mem:
+        if addr < s_mem:
             return None
 
-        idx = (int(addr) - self.s_mem) // bufsize
+        bufsize = self.bufsize
+        idx = (addr - s_mem) // bufsize
         if idx >= self.nr_objects:
             return None
 
-        return int(self.s_mem + (idx * bufsize))
+        return s_mem + idx * bufsize
 
     def contains_obj(self, addr: int) -> Tuple[bool, int, Optional[str]]:
-        obj_addr = self.find_obj(addr)
+        # Same arithmetic as find_obj, inlined since this is called for
+        # every array cache entry during checking
+        addr = int(addr)
+        s_mem = self.s_mem
+        bufsize = self.bufsize
 
-        if not obj_addr:
+        if addr < s_mem:
             return (False, 0, "address outside of valid object range")
 
-        return (True, obj_addr, None)
+        idx = (addr - s_mem) // bufsize
+        if idx >= self.nr_objects:
+            return (False, 0, "address outside of valid object range")
+
+        return (True, s_mem + idx * bufsize, None)
 
     def obj_in_use(self, addr: int) -> Tuple[bool, Optional[str]]:
 
         self.populate_free()
-        if addr in self.free:
+        if self.is_free(addr):
             return (False, None)
 
-        array_caches = self.kmem_cache.get_array_caches()
-
-        if addr in array_caches:
-            ac = array_caches[addr]
+        if addr in self.kmem_cache.get_array_cache_keys():
+            ac = self.kmem_cache.get_array_caches()[addr]
 
             ac_type = ac['ac_type'] # pylint: disable=unsubscriptable-object
             nid_tgt = int(ac['nid_tgt']) # pylint: disable=unsubscriptable-object
@@ -400,22 +579,24 @@ class SlabSLAB(Slab):
                      f"{self.nr_objects} objects allocated", misplaced=True)
 
     def get_objects(self) -> Iterable[int]:
-        bufsize = self.kmem_cache.buffer_size
-        obj = self.s_mem
-        # pylint: disable=unused-variable
-        for i in range(self.nr_objects):
-            yield obj
-            obj += bufsize
+        bufsize = self.bufsize
+        s_mem = self.s_mem
+        return range(s_mem, s_mem + self.nr_objects * bufsize, bufsize)
 
     def get_allocated_objects(self) -> Iterable[int]:
-        for obj in self.get_objects():
-            (in_use, _) = self.obj_in_use(obj)
-            if in_use:
+        # Same test as obj_in_use, but the slot index of each object is
+        # already known so no per-object lookups are needed
+        self.populate_free()
+        free_mask = self.free_mask
+        ac_keys = self.kmem_cache.get_array_cache_keys()
+        for (idx, obj) in enumerate(self.get_objects()):
+            if not (free_mask >> idx) & 1 and obj not in ac_keys:
                 yield obj
 
     def check(self, slabtype: int, nid: int) -> int:
         self.populate_free()
-        num_free = len(self.free)
+        free_mask = self.free_mask
+        num_free = bin(free_mask).count("1")
         max_free = self.nr_objects
 
         if self.kmem_cache.off_slab and not SlabSLAB.page_slab:
@@ -463,18 +644,34 @@ class SlabSLAB(Slab):
                 self._pr_err(f": slab is on nid {slab_nid} instead of {nid}")
                 print(f"free objects {num_free}")
 
-        ac = self.kmem_cache.get_array_caches()
+        ac_keys = self.kmem_cache.get_array_cache_keys()
         last_page_addr = 0
-        for obj in self.get_objects():
-            if obj in self.free and obj in ac:
+        # Objects within the memory covered by the last page share its
+        # checks, so only look up pages once an object falls outside it.
+        # Only a slab that is allocated as one compound page (marked by its
+        # head) covers more than a single page: older kernels didn't use
+        # __GFP_COMP for SLAB, and struct slab kernels keep back-pointers
+        # in every page, which must each be checked.
+        slab_extent = Page.PAGE_SIZE << self.kmem_cache.gfporder
+        extent_start = extent_end = 0
+        for (idx, obj) in enumerate(self.get_objects()):
+            if (free_mask >> idx) & 1 and obj in ac_keys:
                 self._pr_err(f": obj 0x{obj:x} is marked as free but in array cache:")
-                print(ac[obj])
+                print(self.kmem_cache.get_array_caches()[obj])
+            if extent_start <= obj < extent_end:
+                continue
             try:
-                page = page_from_addr(obj).compound_head()
+                page = _compound_page_from_addr(obj)
             except gdb.NotAvailableError:
                 self._pr_err(f": failed to get page for object 0x{obj:x}")
                 continue
 
+            extent_start = page_addr(page.address)
+            if self.page_slab and page.is_slab() and page.is_head():
+                extent_end = extent_start + slab_extent
+            else:
+                extent_end = extent_start + Page.PAGE_SIZE
+
             if page.address == last_page_addr:
                 continue
 
@@ -505,6 +702,7 @@ class SlabSLUB(Slab):
 
     def __init__(self, gdb_obj: gdb.Value, kmem_cache: 'KmemCacheSLUB') -> None:
         super().__init__(gdb_obj, kmem_cache)
+        self.free: Set[int] = set()
         self.nr_objects = int(gdb_obj["objects"])
         self.nr_inuse = int(gdb_obj["inuse"])
         self.nr_free = self.nr_objects - self.nr_inuse
@@ -656,10 +854,11 @@ class SlabSLUB(Slab):
         if page.type.code == gdb.TYPE_CODE_PTR:
             page = page.dereference()
         kmem_cache_addr = int(page["slab_cache"])
-        kmem_cache = kmem_cache_from_addr(kmem_cache_addr)
-        if kmem_cache is None:
-            raise RuntimeError("No kmem cache found for page")
-        kmem_cache = cast(KmemCacheSLUB, kmem_cache)
+        cache = _kmem_cache_lookup(kmem_cache_addr)
+        if cache is None:
+            raise KmemCacheNotFound(f"No kmem cache found for page "
+                                    f"0x{int(page.address):x}")
+        kmem_cache = cast(KmemCacheSLUB, cache)
         return cls(page, kmem_cache)
 
     @classmethod
@@ -708,7 +907,11 @@ class KmemCache(ABC):
 
         self.objs_per_slab = 0
 
+        self._nodelists: Optional[List[Tuple[int, gdb.Value]]] = None
+
         self.array_caches: Dict[int, Dict] = dict()
+        self.array_cache_keys: FrozenSet[int] = frozenset()
+        self.array_cache_pages: Dict[int, Page] = dict()
 
     @classmethod
     def check_kmem_cache_type(cls, gdbtype: gdb.Type) -> None:
@@ -756,11 +959,16 @@ class KmemCache(ABC):
         return self.gdb_obj[KmemCache.nodelists_name][node]
 
     def _get_nodelists(self) -> Iterable[Tuple[int, gdb.Value]]:
-        for nid in for_each_nid():
-            node = self._get_nodelist(nid)
-            if int(node) == 0:
-                continue
-            yield (nid, node.dereference())
+        # The node structures don't move, resolve them once per cache
+        if self._nodelists is None:
+            nodelists = self.gdb_obj[KmemCache.nodelists_name]
+            self._nodelists = list()
+            for nid in for_each_nid():
+                node = nodelists[nid]
+                if int(node) == 0:
+                    continue
+                self._nodelists.append((nid, node.dereference()))
+        return self._nodelists
 
     def _pr_err(self, msg: str) -> None:
         msg = col_error(f"cache {self.name}{msg}")
@@ -768,14 +976,23 @@ class KmemCache(ABC):
 
 class KmemCacheSLAB(KmemCache):
 
-    slab_list_name = {0: "partial", 1: "full", 2: "free"}
-    slab_list_fullname = {0: "slabs_partial", 1: "slabs_full", 2: "slabs_free"}
+    # Indexed by SlabSLAB.slab_partial, slab_full and slab_free
+    slab_list_name = ("partial", "full", "free")
+    slab_list_fullname = ("slabs_partial", "slabs_full", "slabs_free")
     buffer_size: int
+    # Python tracebacks printed per slab list traversal; further errors
+    # are only reported by address
+    MAX_TRACEBACKS = 3
 
     def __init__(self, name: str, gdb_obj: gdb.Value) -> None:
         super().__init__(name, gdb_obj)
         self.objs_per_slab = int(gdb_obj["num"])
         self.buffer_size = int(gdb_obj[KmemCache.buffer_size_name])
+        self.gfporder = int(gdb_obj["gfporder"])
+        self._wrong_list_cache: Dict[Tuple[int, int], Dict[int, int]] = dict()
+        self._slab_list_heads_cache: Dict[int, Tuple[int, ...]] = dict()
+        # Slabs visited by check_all, by the pfns their objects occupy
+        self._slabs_by_pfn: Dict[int, SlabSLAB] = dict()
 
         if int(gdb_obj["flags"]) & 0x80000000:
             self.off_slab = True
@@ -793,6 +1010,15 @@ class KmemCacheSLAB(KmemCache):
         print("Not yet implemented for SLAB")
 
     def check_all(self) -> None:
+        _start_compound_cache()
+        self._slabs_by_pfn = dict()
+        try:
+            self.__check_all()
+        finally:
+            _stop_compound_cache()
+            self._slabs_by_pfn = dict()
+
+    def __check_all(self) -> None:
         nr_slabs = 0
         nr_objs = 0
         nr_free = 0
@@ -808,9 +1034,7 @@ class KmemCacheSLAB(KmemCache):
 #                print("Can't check lock state -- locking implementation unknown.")
 
             free_declared = int(node["free_objects"])
-            free_counted = self.__check_slabs(node, SlabSLAB.slab_partial, nid)
-            free_counted += self.__check_slabs(node, SlabSLAB.slab_full, nid)
-            free_counted += self.__check_slabs(node, SlabSLAB.slab_free, nid)
+            free_counted = self.__check_all_slab_lists(node, nid)
 
             if free_declared != free_counted:
                 self._pr_err(f": free objects mismatch on node {nid}: "
@@ -841,15 +1065,19 @@ class KmemCacheSLAB(KmemCache):
         if ac_type == SlabSLAB.AC_PERCPU:
             nid_tgt = numa_node_id(nid_tgt)
 
-        for i in range(avail):
-            ptr = int(acache["entry"][i])
+        # The entries are a contiguous array of pointers, read it at once
+        entry = acache["entry"]
+        entries = read_uint_array(int(entry.address), avail,
+                                  entry.type.target().sizeof)
+        for ptr in entries:
             if ptr in self.array_caches:
                 self._pr_err(f": object 0x{ptr:x} is in cache {cache_dict} "
                              f"but also {self.array_caches[ptr]}")
             else:
                 self.array_caches[ptr] = cache_dict
 
-            page = page_from_addr(ptr)
+            page = _pooled_page_from_addr(ptr)
+            self.array_cache_pages[ptr] = page
             obj_nid = page.get_nid()
 
             if obj_nid != nid_tgt:
@@ -893,6 +1121,7 @@ class KmemCacheSLAB(KmemCache):
 
     def __fill_all_array_caches(self) -> None:
         self.array_caches = dict()
+        self.array_cache_pages = dict()
 
         self.__fill_percpu_caches()
 
@@ -905,34 +1134,75 @@ class KmemCacheSLAB(KmemCache):
 
             self.__fill_alien_caches(node, nid)
 
+        self.array_cache_keys = frozenset(self.array_caches)
+
     def get_array_caches(self) -> Dict[int, ArrayCacheEntry]:
         if not self.array_caches:
             self.__fill_all_array_caches()
 
         return self.array_caches
 
+    def get_array_cache_keys(self) -> FrozenSet[int]:
+        """
+        Returns the addresses of all objects cached in the array caches,
+        for membership tests that don't need the cache descriptions.
+        """
+        if not self.array_caches:
+            self.__fill_all_array_caches()
+
+        return self.array_cache_keys
+
+    def _slab_list_heads(self, node: gdb.Value) -> Tuple[int, ...]:
+        node_addr = int(node.address)
+        heads = self._slab_list_heads_cache.get(node_addr)
+        if heads is None:
+            heads = tuple(int(node[name].address)
+                          for name in self.slab_list_fullname)
+            self._slab_list_heads_cache[node_addr] = heads
+        return heads
+
+    def _wrong_list_nodes(self, node: gdb.Value, slabtype: int,
+                          list_heads: Optional[Tuple[int, ...]] = None
+                          ) -> Dict[int, int]:
+        # Maps the heads of the other slab lists of the node to their type,
+        # the slab lists of a node are traversed repeatedly
+        key = (int(node.address), slabtype)
+        wrong_list_nodes = self._wrong_list_cache.get(key)
+        if wrong_list_nodes is None:
+            if list_heads is None:
+                list_heads = self._slab_list_heads(node)
+            wrong_list_nodes = {head: stype
+                                for (stype, head) in enumerate(list_heads)
+                                if stype != slabtype}
+            self._wrong_list_cache[key] = wrong_list_nodes
+        return wrong_list_nodes
+
     def get_slabs_of_type(self, node: gdb.Value, slabtype: int,
                           reverse: bool = False,
-                          exact_cycles: bool = False) -> Iterable[SlabSLAB]:
-        wrong_list_nodes = dict()
-        for stype in range(3):
-            if stype != slabtype:
-                wrong_list_nodes[int(node[self.slab_list_fullname[stype]].address)] = stype
+                          exact_cycles: bool = False,
+                          list_heads: Optional[Tuple[int, ...]] = None
+                          ) -> Iterable[SlabSLAB]:
+        wrong_list_nodes = self._wrong_list_nodes(node, slabtype, list_heads)
+
+        tracebacks_printed = 0
 
         slab_list = node[self.slab_list_fullname[slabtype]]
-        for list_head in list_for_each(slab_list, reverse=reverse, exact_cycles=exact_cycles):
+        for list_head in list_for_each(slab_list, reverse=reverse,
+                                       exact_cycles=exact_cycles):
             addr = int(list_head.address)
             try:
-                if addr in wrong_list_nodes.keys():
-                    wrong_type = wrong_list_nodes[addr]
+                wrong_type = wrong_list_nodes.get(addr)
+                if wrong_type is not None:
                     self._pr_err(f": encountered head of {self.slab_list_name[wrong_type]} "
                                  f"slab list while traversing {self.slab_list_name[slabtype]} "
                                  f"slab list, skipping")
                     continue
 
-                slab = SlabSLAB.from_list_head(list_head, self)
+                slab = SlabSLAB.from_list_head_addr(addr, self)
             except gdb.NotAvailableError:
-                traceback.print_exc()
+                if tracebacks_printed < self.MAX_TRACEBACKS:
+                    traceback.print_exc()
+                    tracebacks_printed += 1
                 self._pr_err(f": failed to initialize slab object from list_head "
                              f"0x{addr:x}: {sys.exc_info()[0]}")
                 continue
@@ -982,6 +1252,7 @@ class KmemCacheSLAB(KmemCache):
         return free
 
     def ___check_slabs(self, node: gdb.Value, slabtype: int, nid: int,
+                       list_heads: Tuple[int, ...],
                        reverse: bool = False) -> Tuple[bool, int, int]:
         slabs = 0
         free = 0
@@ -992,17 +1263,22 @@ class KmemCacheSLAB(KmemCache):
                   'num_ok': 0,
                   'first_misplaced': None,
                   'last_misplaced': None,
-                  'num_misplaced': 0}
+                  'num_misplaced': 0,
+                  'tracebacks_printed': 0}
 
         try:
             for slab in self.get_slabs_of_type(node, slabtype, reverse,
-                                               exact_cycles=True):
+                                               exact_cycles=True,
+                                               list_heads=list_heads):
                 try:
                     free += self.__check_slab(slab, slabtype, nid, errors)
+                    self.__remember_slab(slab)
                 except gdb.NotAvailableError as e:
                     self._pr_err(f": exception when checking slab "
                                  f"0x{slab.address:x}: {e}")
-                    traceback.print_exc()
+                    if errors['tracebacks_printed'] < self.MAX_TRACEBACKS:
+                        traceback.print_exc()
+                        errors['tracebacks_printed'] += 1
                 slabs += 1
 
         except (gdb.NotAvailableError, ListError) as e:
@@ -1024,19 +1300,20 @@ class KmemCacheSLAB(KmemCache):
 
         return (check_ok, slabs, free)
 
-    def __check_slabs(self, node: gdb.Value, slabtype: int, nid: int) -> int:
-
-        slab_list = node[self.slab_list_fullname[slabtype]]
+    def __check_slabs(self, node: gdb.Value, slabtype: int, nid: int,
+                      list_heads: Tuple[int, ...]) -> int:
 
         print(f"checking {self.slab_list_name[slabtype]} slab list "
-              f"0x{int(slab_list.address):x}")
+              f"0x{list_heads[slabtype]:x}")
 
-        (check_ok, slabs, free) = self.___check_slabs(node, slabtype, nid)
+        (check_ok, slabs, free) = self.___check_slabs(node, slabtype, nid,
+                                                      list_heads)
 
         if not check_ok:
             print("Retrying the slab list in reverse order")
             (check_ok, slabs_rev, free_rev) = \
-                self.___check_slabs(node, slabtype, nid, reverse=True)
+                self.___check_slabs(node, slabtype, nid, list_heads,
+                                    reverse=True)
             slabs += slabs_rev
             free += free_rev
 
@@ -1045,23 +1322,56 @@ class KmemCacheSLAB(KmemCache):
 
         return free
 
+    def __check_all_slab_lists(self, node: gdb.Value, nid: int) -> int:
+        # The list heads are needed by every list traversal to detect
+        # wandering onto a different list, resolve them once per node
+        list_heads = self._slab_list_heads(node)
+
+        free = 0
+        for slabtype in (SlabSLAB.slab_partial, SlabSLAB.slab_full,
+                         SlabSLAB.slab_free):
+            free += self.__check_slabs(node, slabtype, nid, list_heads)
+        return free
+
+    def __remember_slab(self, slab: SlabSLAB) -> None:
+        if slab.error or not slab.nr_objects:
+            return
+        first = (slab.s_mem - Page.directmap_base) // Page.PAGE_SIZE
+        last = (slab.s_mem + slab.nr_objects * slab.bufsize - 1 -
+                Page.directmap_base) // Page.PAGE_SIZE
+        for pfn in range(first, last + 1):
+            self._slabs_by_pfn[pfn] = slab
+
     def check_array_caches(self) -> None:
         acs = self.get_array_caches()
+        pages = self.array_cache_pages
+        known_slabs = self._slabs_by_pfn
         for ac_ptr in acs:
-            ac_obj_slab = slab_from_obj_addr(ac_ptr)
+            # Slabs already visited on the slab lists don't need to be
+            # looked up and constructed again
+            ac_obj_slab: Optional[Slab]
+            ac_obj_slab = known_slabs.get((ac_ptr - Page.directmap_base) //
+                                          Page.PAGE_SIZE)
+            if ac_obj_slab is None:
+                # The page was already resolved while filling the array caches
+                page = pages.get(ac_ptr)
+                if page is None:
+                    ac_obj_slab = slab_from_obj_addr(ac_ptr)
+                else:
+                    ac_obj_slab = slab_from_obj_page(page)
             if not ac_obj_slab:
-                self._pr_err(f": cached pointer 0x{ac_ptr:x} in 0x{acs[ac_ptr]:x} "
+                self._pr_err(f": cached pointer 0x{ac_ptr:x} in {acs[ac_ptr]} "
                              f"not found in any slab")
             elif ac_obj_slab.kmem_cache.address != self.address:
-                self._pr_err(f": cached pointer 0x{ac_ptr:x} in 0x{acs[ac_ptr]:x} "
+                self._pr_err(f": cached pointer 0x{ac_ptr:x} in {acs[ac_ptr]} "
                              f"belongs to wrong kmem cache {ac_obj_slab.kmem_cache.name}")
             else:
                 ac_obj_obj = ac_obj_slab.contains_obj(ac_ptr)
                 if ac_obj_obj[0] is False and ac_obj_obj[2] is None:
-                    self._pr_err(f": cached pointer 0x{ac_ptr:x} in 0x{acs[ac_ptr]:x} "
+                    self._pr_err(f": cached pointer 0x{ac_ptr:x} in {acs[ac_ptr]} "
                                  f"is not allocated: {ac_obj_obj}")
                 elif ac_obj_obj[1] != ac_ptr:
-                    self._pr_err(f": cached pointer 0x{ac_ptr:x} in 0x{acs[ac_ptr]:x} "
+                    self._pr_err(f": cached pointer 0x{ac_ptr:x} in {acs[ac_ptr]} "
                                  f"has wrong offset: ({ac_obj_obj[0]}, 0x{ac_obj_obj[1]:x}, "
                                  f"{ac_obj_obj[2]})")
 
@@ -1364,6 +1674,11 @@ def __setup_slab_caches(slab_caches: gdb.Symbol) -> None:
         __kmem_caches[name] = kmem_cache
         __kmem_caches_by_addr[int(cache.address)] = kmem_cache
 
+def _kmem_cache_lookup(addr: int) -> Optional[KmemCache]:
+    # Used on hot paths where a miss is unexpected, avoids setting up
+    # exception handling for every lookup
+    return __kmem_caches_by_addr.get(addr)
+
 # TODO: move the following functions to subsystem/ ?
 def kmem_cache_from_addr(addr: int) -> KmemCache:
     try:
@@ -1385,8 +1700,15 @@ def slab_from_page(page: Page) -> Slab:
         return SlabSLUB.from_page(page)
     return SlabSLAB.from_page(page)
 
+def slab_from_obj_page(page: Page) -> Optional[Slab]:
+    page = page.compound_head()
+    if not page.is_slab():
+        return None
+
+    return slab_from_page(page)
+
 def slab_from_obj_addr(addr: int) -> Optional[Slab]:
-    page = page_from_addr(addr).compound_head()
+    page = _compound_page_from_addr(addr)
     if not page.is_slab():
         return None
 
@@ -1,22 +1,80 @@
 # -*- coding: utf-8 -*-
 # vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
 
-from typing import Iterator, Callable, Dict, List
+from typing import Iterator, Callable, Dict, List, Optional, Set, Tuple
+from typing import FrozenSet
+from typing import cast
 
 import gdb
 
 from crash.target import check_target
 from crash.exceptions import InvalidArgumentError, ArgumentTypeError
 from crash.exceptions import UnexpectedGDBTypeError, MissingFieldError
-from crash.util import array_size, struct_has_member
+from crash.util import array_size, struct_has_member, offsetof_type
+from crash.util import StructReader, InvalidComponentError, read_uint_array
+from crash.util import read_int_array
 from crash.util.symbols import Types, Symvals, SymbolCallbacks
 from crash.types.list import list_for_each_entry
 
 PF_EXITING = 0x4
 
-types = Types(['struct task_struct', 'struct mm_struct', 'atomic_long_t'])
+types = Types(['struct task_struct', 'struct mm_struct'])
 symvals = Symvals(['init_task', 'init_mm'])
 
+def _member_names(gdbtype: gdb.Type) -> FrozenSet[str]:
+    """
+    Returns the names of the members of a structure
+
+    Members of anonymous structures and unions (e.g. everything in a
+    ``struct mm_struct`` since Linux 4.19) are included, since they are
+    read by name just like direct members.
+
+    Args:
+        gdbtype: The structure type.
+
+    Returns:
+        :obj:`frozenset` of :obj:`str`: The member names.
+    """
+    names: Set[str] = set()
+    for field in gdbtype.fields():
+        if field.name:
+            names.add(field.name)
+        else:
+            names |= _member_names(field.type)
+    return frozenset(names)
+
+def _is_atomic_counter(gdbtype: gdb.Type, name: str) -> bool:
+    """
+    Returns whether a structure member is an atomic counter
+    (e.g. ``atomic_long_t``) rather than a plain integer
+    """
+    res = offsetof_type(gdbtype, name)
+    if res is None:
+        return False
+    membertype = res[1].strip_typedefs()
+    return (membertype.code == gdb.TYPE_CODE_STRUCT and
+            'counter' in membertype.keys())
+
+# Maps the names in task_state_array to the state flags they describe.
+# Names are looked up by their parenthesized part, e.g. '(running)' for
+# 'R (running)', except for the two dead states which differ only in
+# their letter.
+_TASK_STATE_NAMES = {
+    '(running)'      : 'TASK_RUNNING',
+    '(sleeping)'     : 'TASK_INTERRUPTIBLE',
+    '(disk sleep)'   : 'TASK_UNINTERRUPTIBLE',
+    '(stopped)'      : 'TASK_STOPPED',
+    '(zombie)'       : 'EXIT_ZOMBIE',
+    'x (dead)'       : 'TASK_DEAD',
+    'X (dead)'       : 'EXIT_DEAD',
+    '(swapping)'     : 'TASK_SWAPPING',
+    '(tracing stop)' : 'TASK_TRACING_STOPPED',
+    '(wakekill)'     : 'TASK_WAKEKILL',
+    '(waking)'       : 'TASK_WAKING',
+    '(parked)'       : 'TASK_PARKED',
+    '(idle)'         : '__TASK_IDLE',
+}
+
 # This is pretty painful.  These are all #defines so none of them end
 # up with symbols in the kernel.  The best approximation we have is
 # task_state_array which doesn't include all of them.  All we can do
@@ -31,6 +89,8 @@ class TaskStateFlags:
     The initial values below are overridden once symbols are available to
     resolve them properly.
     """
+    __slots__ = ()
+
     TASK_RUNNING = 0
 
     TASK_FLAG_UNINITIALIZED = -1
@@ -52,6 +112,20 @@ class TaskStateFlags:
     TASK_NEW: int = TASK_FLAG_UNINITIALIZED
     TASK_IDLE: int = TASK_FLAG_UNINITIALIZED
 
+    # The states of a task that is known to be alive, see
+    # LinuxTask.maybe_dead()
+    KNOWN_LIVE_MASK: int = 0
+
+    _flag_names = frozenset((
+        'TASK_RUNNING', 'TASK_INTERRUPTIBLE', 'TASK_UNINTERRUPTIBLE',
+        'TASK_STOPPED', 'EXIT_ZOMBIE', 'TASK_DEAD', 'EXIT_DEAD',
+        'TASK_SWAPPING', 'TASK_TRACING_STOPPED', 'TASK_WAKEKILL',
+        'TASK_WAKING', 'TASK_PARKED', 'TASK_NOLOAD', 'TASK_NEW', 'TASK_IDLE'))
+
+    # The flags in _flag_names that this kernel has, set once the flags
+    # have been discovered
+    _defined_flags: Optional[FrozenSet[str]] = None
+
     _state_field: str = 'state'
 
     def __init__(self) -> None:
@@ -59,6 +133,8 @@ class TaskStateFlags:
 
     @classmethod
     def has_flag(cls, flagname: str) -> bool:
+        if cls._defined_flags is not None and flagname in cls._flag_names:
+            return flagname in cls._defined_flags
         v = getattr(cls, flagname)
         return v != cls.TASK_FLAG_UNINITIALIZED
 
@@ -77,31 +153,26 @@ class TaskStateFlags:
         Args:
             symbol: The ``task_state_array`` symbol.
         """
+        # Answer has_flag from the attributes until discovery is done
+        cls._defined_flags = None
+
         task_state_array = symbol.value()
         count = array_size(task_state_array)
 
+        # Read the whole table of string pointers at once
+        ptr_type = task_state_array.type.target()
+        ptrs = read_uint_array(int(task_state_array.address), count,
+                               ptr_type.sizeof)
+
         bit = 0
-        for i in range(count):
-            state = task_state_array[i].string()
-            state_strings = {
-                '(running)'      : 'TASK_RUNNING',
-                '(sleeping)'     : 'TASK_INTERRUPTIBLE',
-                '(disk sleep)'   : 'TASK_UNINTERRUPTIBLE',
-                '(stopped)'      : 'TASK_STOPPED',
-                '(zombie)'       : 'EXIT_ZOMBIE',
-                'x (dead)'       : 'TASK_DEAD',
-                'X (dead)'       : 'EXIT_DEAD',
-                '(swapping)'     : 'TASK_SWAPPING',
-                '(tracing stop)' : 'TASK_TRACING_STOPPED',
-                '(wakekill)'     : 'TASK_WAKEKILL',
-                '(waking)'       : 'TASK_WAKING',
-                '(parked)'       : 'TASK_PARKED',
-                '(idle)'         : '__TASK_IDLE',
-            }
-
-            for key in state_strings:
-                if key in state:
-                    setattr(cls, state_strings[key], bit)
+        for ptr in ptrs:
+            state = gdb.Value(ptr).cast(ptr_type).string().strip()
+            key = state[state.find('('):]
+            if key == '(dead)':
+                key = state
+            flag = _TASK_STATE_NAMES.get(key)
+            if flag is not None:
+                setattr(cls, flag, bit)
 
             if bit == 0:
                 bit = 1
@@ -158,23 +229,25 @@ class TaskStateFlags:
         if cls.has_flag('TASK_NEW'):
             assert cls.TASK_NEW == 2048
 
+        cls._defined_flags = frozenset(
+            name for name in cls._flag_names
+            if getattr(cls, name) != cls.TASK_FLAG_UNINITIALIZED)
+
         cls._check_state_bits()
 
-    @classmethod
-    def _check_state_bits(cls) -> None:
-        required = [
-            'TASK_RUNNING',
-            'TASK_INTERRUPTIBLE',
-            'TASK_UNINTERRUPTIBLE',
-            'EXIT_ZOMBIE',
-            'TASK_STOPPED',
-        ]
+        cls.KNOWN_LIVE_MASK = (cls.TASK_INTERRUPTIBLE |
+                               cls.TASK_UNINTERRUPTIBLE |
+                               cls.EXIT_ZOMBIE | cls.TASK_STOPPED)
+        if cls.has_flag('TASK_SWAPPING'):
+            cls.KNOWN_LIVE_MASK |= cls.TASK_SWAPPING
 
-        missing = []
+    _required_states = ('TASK_RUNNING', 'TASK_INTERRUPTIBLE',
+                        'TASK_UNINTERRUPTIBLE', 'EXIT_ZOMBIE', 'TASK_STOPPED')
 
-        for bit in required:
-            if not cls.has_flag(bit):
-                missing.append(bit)
+    @classmethod
+    def _check_state_bits(cls) -> None:
+        missing = [bit for bit in cls._required_states
+                   if not cls.has_flag(bit)]
 
         if missing:
             raise RuntimeError("Missing required task states: {}"
@@ -219,29 +292,102 @@ class LinuxTask:
         :obj:`.InvalidArgumentError`: The cpu number was not ``None`` or an
             :obj:`int`.
     """
+    # One of these exists for every task, so keep them small.  The stack
+    # pointer attributes are filled in by the target code.
+    __slots__ = ('task_struct', 'active', 'cpu', 'regs', 'thread_struct',
+                 'thread_info', 'thread', 'stack_pointer', 'valid_stack',
+                 'mem_valid', 'rss', 'total_vm', 'pgd_addr',
+                 '_snapshot_valid', '_state', '_flags', '_pid', '_mm',
+                 '_is_kernel', '_address')
+
     _valid = False
     _task_state_has_exit_state = None
-    _anon_file_rss_fields: List[str] = list()
+    # The name of each field and whether it is an atomic counter
+    _anon_file_rss_fields: List[Tuple[str, bool]] = list()
+    _rss_is_atomic = False
 
     # Version-specific hooks -- these will be None here but we'll raise a
     # NotImplementedError if any of them aren't found.
-    _get_rss: Callable[['LinuxTask'], int]
+    _get_rss: Callable[['LinuxTask', gdb.Value], int]
     _get_last_run: Callable[['LinuxTask'], int]
 
-    _state_field: str
+    # Members whose presence or name depends on the kernel version,
+    # checked once by _init_task_types
+    _state_member = 'state'
+    _has_cpu = False
+    # The member holding the last run time, unless it is
+    # sched_info.last_arrival
+    _last_run_member: str
+
+    # The address of init_mm, or None if the symbol isn't available
+    _init_mm_addr: Optional[int] = None
+
+    _PF_EXITING = PF_EXITING
+    # Reads total_vm and pgd in a single memory access, if possible
+    _mm_reader: Optional[StructReader] = None
+    _rss_member: str
+    # Number of entries in mm_struct.rss_stat.count (NR_MM_COUNTERS)
+    _nr_mm_counters = 0
+    # Offset of rss_stat.count in mm_struct and the size of each counter
+    _rss_stat_offset = 0
+    _rss_counter_size = 0
+
+    # Reads state, flags, pid, mm and, if present, exit_state in a single
+    # memory access.  None if the fields can't be unpacked directly.
+    _snapshot_reader: Optional[StructReader] = None
+    # The members of the snapshot, in the order _store_snapshot expects
+    _snapshot_members: List[str] = list()
+    _read_snapshot: Callable[['LinuxTask'], None]
+    _store_snapshot: Callable[['LinuxTask', Tuple[int, ...]], None]
+
+    # Resolved once by _init_task_types for the type checks in __init__
+    _task_struct_type: gdb.Type
+    _task_struct_p_type: gdb.Type
 
     def __init__(self, task_struct: gdb.Value) -> None:
-        self._init_task_types(task_struct)
-
         if not isinstance(task_struct, gdb.Value):
             raise ArgumentTypeError('task_struct', task_struct, gdb.Value)
 
-        if not (task_struct.type == types.task_struct_type or
-                task_struct.type == types.task_struct_type.pointer()):
+        if not self._valid:
+            self._init_task_types(task_struct)
+
+        task_type = task_struct.type
+        if not (task_type == self._task_struct_type or
+                task_type == self._task_struct_p_type):
             raise UnexpectedGDBTypeError('task_struct', task_struct,
-                                         types.task_struct_type)
+                                         self._task_struct_type)
+
+        if task_type == self._task_struct_p_type:
+            address = int(task_struct)
+        else:
+            address = int(task_struct.address)
+        self._setup(task_struct, address)
+
+    @classmethod
+    def _from_trusted(cls, task_struct: gdb.Value,
+                      address: int) -> 'LinuxTask':
+        """
+        Create a LinuxTask without validating the argument
+
+        This is for internal callers that build the ``struct task_struct``
+        value themselves, e.g. while loading every task at startup.
+
+        Args:
+            task_struct: The task to wrap.  The value must be of type
+                ``struct task_struct`` and the task types must already
+                have been initialized.
+            address: The address of the task_struct
 
+        Returns:
+            :obj:`LinuxTask`: The new task object
+        """
+        ltask = cls.__new__(cls)
+        ltask._setup(task_struct, address)
+        return ltask
+
+    def _setup(self, task_struct: gdb.Value, address: int) -> None:
         self.task_struct = task_struct
+        self._address = address
         self.active = False
         self.cpu = -1
         self.regs: Dict[str, int] = dict()
@@ -250,12 +396,30 @@ class LinuxTask:
         self.thread_info: gdb.Value
         self.thread: gdb.InferiorThread
 
+        # The dump doesn't change underneath us, so these are read once,
+        # together, the first time any of them is needed
+        self._snapshot_valid = False
+        self._state = 0
+        self._flags = 0
+        self._pid = 0
+        self._mm = 0
+        self._is_kernel: Optional[bool] = None
+
         # mem data
         self.mem_valid = False
         self.rss = 0
         self.total_vm = 0
         self.pgd_addr = 0
 
+    # Tasks are identified by the address of their task_struct
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, LinuxTask):
+            return NotImplemented
+        return self._address == other._address
+
+    def __hash__(self) -> int:
+        return hash(self._address)
+
     @classmethod
     def _init_task_types(cls, task: gdb.Value) -> None:
         if not cls._valid:
@@ -269,19 +433,74 @@ class LinuxTask:
             # within gdb.  Equality requires a deep comparison rather than
             # a simple pointer comparison.
             types.override('struct task_struct', task.type)
-            fields = [x.name for x in types.task_struct_type.fields()]
+            cls._task_struct_type = task.type
+            cls._task_struct_p_type = task.type.pointer()
+            fields = _member_names(types.task_struct_type)
             cls._task_state_has_exit_state = 'exit_state' in fields
             if 'state' in fields:
-                cls._state_field = 'state'
+                cls._state_member = 'state'
             elif '__state' in fields:
-                cls._state_field = '__state'
+                cls._state_member = '__state'
             else:
                 raise MissingFieldError("No way to resolve task_struct.state")
-
-            cls._pick_get_rss()
-            cls._pick_last_run()
+            cls._has_cpu = 'cpu' in fields
+            try:
+                cls._init_mm_addr = int(symvals.init_mm.address)
+            except AttributeError:
+                cls._init_mm_addr = None
+            cls._setup_snapshot_reader(task.type)
+
+            mm_fields = _member_names(types.mm_struct_type)
+            try:
+                cls._mm_reader = StructReader(types.mm_struct_type,
+                                              ['total_vm', 'pgd'])
+            except (InvalidComponentError, TypeError):
+                cls._mm_reader = None
+
+            cls._pick_get_rss(mm_fields)
+            cls._pick_last_run(fields)
             cls._valid = True
 
+    @classmethod
+    def _setup_snapshot_reader(cls, gdbtype: gdb.Type) -> None:
+        members = [cls._state_member, 'flags', 'pid', 'mm']
+        if cls._task_state_has_exit_state:
+            members.append('exit_state')
+            cls._store_snapshot = cls._store_snapshot_exit_state
+        else:
+            cls._store_snapshot = cls._store_snapshot_state
+        cls._snapshot_members = members
+        try:
+            cls._snapshot_reader = StructReader(gdbtype, members)
+            cls._read_snapshot = cls._read_snapshot_bulk
+        except (InvalidComponentError, TypeError):
+            # Fall back to reading the fields individually
+            cls._snapshot_reader = None
+            cls._read_snapshot = cls._read_snapshot_fields
+
+    # _setup_snapshot_reader picks one of these as _read_snapshot
+
+    def _read_snapshot_bulk(self) -> None:
+        reader = cast(StructReader, self._snapshot_reader)
+        self._store_snapshot(reader.read(self.task_address()))
+
+    def _read_snapshot_fields(self) -> None:
+        ts = self.task_struct
+        self._store_snapshot(tuple(int(ts[name])
+                                   for name in self._snapshot_members))
+
+    # ... and one of these as _store_snapshot, depending on whether
+    # task_struct has an exit_state member
+
+    def _store_snapshot_state(self, vals: Tuple[int, ...]) -> None:
+        (self._state, self._flags, self._pid, self._mm) = vals
+        self._snapshot_valid = True
+
+    def _store_snapshot_exit_state(self, vals: Tuple[int, ...]) -> None:
+        (state, self._flags, self._pid, self._mm, exit_state) = vals
+        self._state = state | exit_state
+        self._snapshot_valid = True
+
     def set_active(self, cpu: int, regs: Dict[str, int]) -> None:
         """
         Set this task as active in the debugging environment
@@ -311,6 +530,11 @@ class LinuxTask:
             raise TypeError("Expected gdb.InferiorThread")
         self.thread = thread
 
+    def _attach_thread_fast(self, thread: gdb.InferiorThread) -> None:
+        # For internal callers that already know thread is a
+        # gdb.InferiorThread
+        self.thread = thread
+
     def set_thread_struct(self, thread_struct: gdb.Value) -> None:
         """
         Set the thread struct for this task
@@ -372,11 +596,9 @@ class LinuxTask:
         Returns:
             :obj:`int`: The last cpu this task was scheduled to execute on
         """
-        if struct_has_member(self.task_struct, 'cpu'):
-            cpu = self.task_struct['cpu']
-        else:
-            cpu = self.thread_info['cpu']
-        return int(cpu)
+        if self._has_cpu:
+            return int(self.task_struct['cpu'])
+        return int(self.thread_info['cpu'])
 
     # Hrm.  This seems broken since we're combining flags from
     # two fields.
@@ -388,10 +610,9 @@ class LinuxTask:
         Returns:
             :obj:`int`: The state flags for this task.
         """
-        state = int(self.task_struct[self._state_field])
-        if self._task_state_has_exit_state:
-            state |= int(self.task_struct['exit_state'])
-        return state
+        if not self._snapshot_valid:
+            self._read_snapshot()
+        return self._state
 
     def maybe_dead(self) -> bool:
         """
@@ -400,16 +621,9 @@ class LinuxTask:
         Returns:
             :obj:`bool`: Whether this task is dead
         """
-        state = self.task_state()
-
-        known = TF.TASK_INTERRUPTIBLE
-        known |= TF.TASK_UNINTERRUPTIBLE
-        known |= TF.EXIT_ZOMBIE
-        known |= TF.TASK_STOPPED
-
-        if TF.has_flag('TASK_SWAPPING'):
-            known |= TF.TASK_SWAPPING
-        return (state & known) == 0
+        if not self._snapshot_valid:
+            self._read_snapshot()
+        return (self._state & TF.KNOWN_LIVE_MASK) == 0
 
     def task_flags(self) -> int:
         """
@@ -418,7 +632,9 @@ class LinuxTask:
         Returns:
             :obj:`int`: The flags for this task
         """
-        return int(self.task_struct['flags'])
+        if not self._snapshot_valid:
+            self._read_snapshot()
+        return self._flags
 
     def is_exiting(self) -> bool:
         """
@@ -427,7 +643,9 @@ class LinuxTask:
         Returns:
             :obj:`bool`: Whether the task is exiting
         """
-        return (self.task_flags() & PF_EXITING) != 0
+        if not self._snapshot_valid:
+            self._read_snapshot()
+        return (self._flags & self._PF_EXITING) != 0
 
     def is_zombie(self) -> bool:
         """
@@ -436,7 +654,9 @@ class LinuxTask:
         Returns:
             :obj:`bool`: Whether the task is in zombie state
         """
-        return (self.task_state() & TF.EXIT_ZOMBIE) != 0
+        if not self._snapshot_valid:
+            self._read_snapshot()
+        return (self._state & TF.EXIT_ZOMBIE) != 0
 
     def is_thread_group_leader(self) -> bool:
         """
@@ -460,14 +680,17 @@ class LinuxTask:
         if self.is_zombie() or self.is_exiting():
             return
 
-        mm = self.task_struct['mm']
-        if not mm:
+        if self._mm == 0:
             self.mem_valid = True
             return
 
-        self.rss = self.get_rss()
-        self.total_vm = int(mm['total_vm'])
-        self.pgd_addr = int(mm['pgd'])
+        mm = self.task_struct['mm']
+        self.rss = self._get_rss(mm)
+        if self._mm_reader is not None:
+            (self.total_vm, self.pgd_addr) = self._mm_reader.read(self._mm)
+        else:
+            self.total_vm = int(mm['total_vm'])
+            self.pgd_addr = int(mm['pgd'])
         self.mem_valid = True
 
     def task_name(self, brackets: bool = False) -> str:
@@ -493,7 +716,9 @@ class LinuxTask:
         Returns:
             :obj:`int`: The pid of this task
         """
-        return int(self.task_struct['pid'])
+        if not self._snapshot_valid:
+            self._read_snapshot()
+        return self._pid
 
     def parent_pid(self) -> int:
         """
@@ -511,23 +736,28 @@ class LinuxTask:
         Returns:
             :obj:`int`: The address of the task_struct
         """
-        return int(self.task_struct.address)
+        return self._address
 
     def is_kernel_task(self) -> bool:
-        if self.task_struct['pid'] == 0:
+        is_kernel = self._is_kernel
+        if is_kernel is None:
+            is_kernel = self._is_kernel_task()
+            self._is_kernel = is_kernel
+        return is_kernel
+
+    def _is_kernel_task(self) -> bool:
+        # Reads the snapshot used below
+        if self.task_pid() == 0:
             return True
 
-        if self.is_zombie() or self.is_exiting():
+        # Exiting user tasks may already have dropped their mm, so this
+        # has to come before the mm tests
+        if (self._state & TF.EXIT_ZOMBIE or
+                self._flags & self._PF_EXITING):
             return False
 
-        mm = self.task_struct['mm']
-        if mm == 0:
-            return True
-
-        if symvals.init_mm and mm == symvals.init_mm.address:
-            return True
-
-        return False
+        mm = self._mm
+        return mm in (0, self._init_mm_addr)
 
     def get_stack_pointer(self) -> int:
         """
@@ -543,53 +773,76 @@ class LinuxTask:
         target = check_target()
         return target.get_stack_pointer(self.thread)
 
-    def _get_rss_field(self) -> int:
-        return int(self.task_struct['mm']['rss'].value())
+    # The RSS accessors take the task's mm_struct since the caller
+    # has already read it
 
-    def _get__rss_field(self) -> int:
-        return int(self.task_struct['mm']['_rss'].value())
+    def _get_rss_field(self, mm: gdb.Value) -> int:
+        # Covers both mm_struct.rss and mm_struct._rss
+        rss = mm[self._rss_member]
+        if self._rss_is_atomic:
+            rss = rss['counter']
+        return int(rss)
 
-    def _get_rss_stat_field(self) -> int:
-        stat = self.task_struct['mm']['rss_stat']['count']
-        rss = 0
-        for i in range(array_size(stat)):
-            rss += int(stat[i]['counter'])
-        return rss
+    def _get_rss_stat_field(self, mm: gdb.Value) -> int:
+        # The counters are atomic_long_t, so the array is one of longs
+        return sum(read_int_array(int(mm) + self._rss_stat_offset,
+                                  self._nr_mm_counters,
+                                  self._rss_counter_size))
 
-    def _get_anon_file_rss_fields(self) -> int:
-        mm = self.task_struct['mm']
+    def _get_anon_file_rss_fields(self, mm: gdb.Value) -> int:
         rss = 0
-        for name in self._anon_file_rss_fields:
-            if mm[name].type == types.atomic_long_t_type:
-                rss += int(mm[name]['counter'])
-            else:
-                rss += int(mm[name])
+        for (key, atomic) in self._anon_file_rss_fields:
+            val = mm[key]
+            if atomic:
+                val = val['counter']
+            rss += int(val)
         return rss
 
     # The Pythonic way to do this is by generating the LinuxTask class
     # dynamically.  We may do that eventually, but for now we can just
     # select the proper function and assign it to the class.
     @classmethod
-    def _pick_get_rss(cls) -> None:
-        if struct_has_member(types.mm_struct_type, 'rss'):
+    def _pick_get_rss(cls, mm_fields: FrozenSet[str]) -> None:
+        if 'rss' in mm_fields:
+            cls._get_rss = cls._get_rss_field
+            cls._rss_member = 'rss'
+            cls._rss_is_atomic = _is_atomic_counter(types.mm_struct_type,
+                                                    'rss')
+        elif '_rss' in mm_fields:
             cls._get_rss = cls._get_rss_field
-        elif struct_has_member(types.mm_struct_type, '_rss'):
-            cls._get_rss = cls._get__rss_field
-        elif struct_has_member(types.mm_struct_type, 'rss_stat'):
+            cls._rss_member = '_rss'
+            cls._rss_is_atomic = _is_atomic_counter(types.mm_struct_type,
+                                                    '_rss')
+        elif 'rss_stat' in mm_fields:
+            res = offsetof_type(types.mm_struct_type, 'rss_stat.count',
+                                error=False)
+            if res is None:
+                # e.g. an array of percpu_counter.  Tasks can still be
+                # enumerated, only get_rss fails.
+                cls._get_rss = cls._get_rss_unsupported
+                return
             cls._get_rss = cls._get_rss_stat_field
+            (cls._rss_stat_offset, count_type) = res
+            cls._rss_counter_size = count_type.target().sizeof
+            cls._nr_mm_counters = (count_type.sizeof //
+                                   cls._rss_counter_size)
         else:
-            if struct_has_member(types.mm_struct_type, '_file_rss'):
-                cls._anon_file_rss_fields.append('_file_rss')
-
-            if struct_has_member(types.mm_struct_type, '_anon_rss'):
-                cls._anon_file_rss_fields.append('_anon_rss')
+            cls._anon_file_rss_fields = list()
+            for name in ('_file_rss', '_anon_rss'):
+                if name in mm_fields:
+                    atomic = _is_atomic_counter(types.mm_struct_type, name)
+                    cls._anon_file_rss_fields.append((name, atomic))
 
             cls._get_rss = cls._get_anon_file_rss_fields
 
             if not cls._anon_file_rss_fields:
                 raise RuntimeError("No method to retrieve RSS from task found.")
 
-    def __get_rss(self) -> int:
+    def _get_rss_unsupported(self, mm: gdb.Value) -> int:
+        # pylint: disable=unused-argument
+        raise RuntimeError("No method to retrieve RSS from task found.")
+
+    def __get_rss(self, mm: gdb.Value) -> int:
         raise NotImplementedError("_get_rss not implemented")
 
     def get_rss(self) -> int:
@@ -599,29 +852,29 @@ class LinuxTask:
         Returns:
             :obj:`int`: The size of the resident memory set for this task
         """
-        return self._get_rss()
-
-    def _last_run__last_run(self) -> int:
-        return int(self.task_struct['last_run'])
+        return self._get_rss(self.task_struct['mm'])
 
-    def _last_run__timestamp(self) -> int:
-        return int(self.task_struct['timestamp'])
+    # Covers both task_struct.last_run and task_struct.timestamp
+    def _last_run__field(self) -> int:
+        return int(self.task_struct[self._last_run_member])
 
     def _last_run__last_arrival(self) -> int:
         return int(self.task_struct['sched_info']['last_arrival'])
 
     @classmethod
-    def _pick_last_run(cls) -> None:
-        fields = types.task_struct_type.keys()
+    def _pick_last_run(cls, fields: FrozenSet[str]) -> None:
         if ('sched_info' in fields and
-                'last_arrival' in types.task_struct_type['sched_info'].type.keys()):
+                struct_has_member(types.task_struct_type,
+                                  'sched_info.last_arrival')):
             cls._get_last_run = cls._last_run__last_arrival
 
         elif 'last_run' in fields:
-            cls._get_last_run = cls._last_run__last_run
+            cls._get_last_run = cls._last_run__field
+            cls._last_run_member = 'last_run'
 
         elif 'timestamp' in fields:
-            cls._get_last_run = cls._last_run__timestamp
+            cls._get_last_run = cls._last_run__field
+            cls._last_run_member = 'timestamp'
         else:
             raise RuntimeError("No method to retrieve last run from task found.")
 
@@ -642,10 +895,9 @@ def for_each_thread_group_leader() -> Iterator[gdb.Value]:
         :obj:`gdb.Value`: The next task on the list.  The value is of
         type ``struct task_struct``.
     """
-    task_list = symvals.init_task['tasks']
-    for task in list_for_each_entry(task_list, symvals.init_task.type,
-                                    'tasks', include_head=True):
-        yield task
+    init_task = symvals.init_task
+    yield from list_for_each_entry(init_task['tasks'], init_task.type,
+                                   'tasks', include_head=True)
 
 def for_each_thread_in_group(task: gdb.Value) -> Iterator[gdb.Value]:
     """
@@ -660,10 +912,8 @@ def for_each_thread_in_group(task: gdb.Value) -> Iterator[gdb.Value]:
         :obj:`gdb.Value`: The next task on the list.  The value is of type
         ``struct task_struct``.
     """
-    thread_list = task['thread_group']
-    for thread in list_for_each_entry(thread_list, symvals.init_task.type,
-                                      'thread_group'):
-        yield thread
+    yield from list_for_each_entry(task['thread_group'],
+                                   types.task_struct_type, 'thread_group')
 
 def for_each_all_tasks() -> Iterator[gdb.Value]:
     """
@@ -674,7 +924,11 @@ def for_each_all_tasks() -> Iterator[gdb.Value]:
         :obj:`gdb.Value`: The next task on the list.  The value is of type
         ``struct task_struct``.
     """
-    for leader in for_each_thread_group_leader():
+    init_task = symvals.init_task
+    task_type = init_task.type
+    for leader in list_for_each_entry(init_task['tasks'], task_type,
+                                      'tasks', include_head=True):
         yield leader
-        for task in for_each_thread_in_group(leader):
+        for task in list_for_each_entry(leader['thread_group'], task_type,
+                                        'thread_group'):
             yield task
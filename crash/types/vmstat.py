@@ -1,10 +1,11 @@
 #!/usr/bin/python3
 # vim:set shiftwidth=4 softtabstop=4 expandtab textwidth=79:
 
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 import gdb
 
+from crash.util import read_uint_array
 from crash.util.symbols import Types, TypeCallbacks, Symbols
 from crash.types.percpu import get_percpu_var
 from crash.types.cpu import for_each_online_cpu
@@ -19,6 +20,12 @@ class VmStat:
     vm_stat_names: List[str] = list()
     vm_event_names: List[str] = list()
 
+    # The address of each online CPU's vm_event_states.event array and
+    # the size of its elements.  The dump doesn't change underneath us,
+    # so these are resolved once.
+    _event_addrs: Optional[List[int]] = None
+    _event_size = 0
+
     @classmethod
     def check_enum_type(cls, gdbtype: gdb.Type) -> None:
         if gdbtype == cls.types.enum_zone_stat_item_type:
@@ -55,15 +62,31 @@ class VmStat:
     def get_event_names(cls) -> List[str]:
         return cls.vm_event_names
 
+    @classmethod
+    def _get_event_addrs(cls) -> List[int]:
+        if cls._event_addrs is not None:
+            return cls._event_addrs
+
+        addrs: List[int] = list()
+        for cpu in for_each_online_cpu():
+            states = get_percpu_var(cls.symbols.vm_event_states, cpu)
+            event = states["event"]
+            cls._event_size = event.type.target().sizeof
+            addrs.append(int(event.address))
+
+        # Don't remember an empty list if the online CPUs aren't known yet
+        if addrs:
+            cls._event_addrs = addrs
+        return addrs
+
     @classmethod
     def get_events(cls) -> List[int]:
         nr = cls.nr_event_items
         events = [0] * nr
 
-        for cpu in for_each_online_cpu():
-            states = get_percpu_var(cls.symbols.vm_event_states, cpu)
-            for item in range(0, nr):
-                events[item] += int(states["event"][item])
+        for addr in cls._get_event_addrs():
+            counts = read_uint_array(addr, nr, cls._event_size)
+            events = [x + y for (x, y) in zip(events, counts)]
 
         return events
 
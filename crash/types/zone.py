@@ -5,7 +5,7 @@ from typing import List
 
 import gdb
 
-from crash.util import array_for_each
+from crash.util import array_for_each, read_int_array
 from crash.util.symbols import Types
 from crash.types.percpu import get_percpu_var
 from crash.types.vmstat import VmStat
@@ -26,20 +26,23 @@ class Zone:
         return self.gdb_obj["present_pages"] != 0
 
     def get_vmstat(self) -> List[int]:
-        stats = [0] * VmStat.nr_stat_items
         vm_stat = self.gdb_obj["vm_stat"]
 
-        for item in range(0, VmStat.nr_stat_items):
-            # TODO abstract atomic?
-            stats[item] = int(vm_stat[item]["counter"])
-        return stats
+        # TODO abstract atomic?  The counters are atomic_long_t, which
+        # are read here as the longs they wrap.
+        stats = read_int_array(int(vm_stat.address), VmStat.nr_stat_items,
+                               vm_stat.type.target().sizeof)
+        return list(stats)
 
     def add_vmstat_diffs(self, diffs: List[int]) -> None:
         for cpu in for_each_online_cpu():
             pageset = get_percpu_var(self.gdb_obj["pageset"], cpu)
             vmdiff = pageset["vm_stat_diff"]
-            for item in range(0, VmStat.nr_stat_items):
-                diffs[item] += int(vmdiff[item])
+            counts = read_int_array(int(vmdiff.address),
+                                    VmStat.nr_stat_items,
+                                    vmdiff.type.target().sizeof)
+            for (item, count) in enumerate(counts):
+                diffs[item] += count
 
     def get_vmstat_diffs(self) -> List[int]:
         diffs = [0] * VmStat.nr_stat_items
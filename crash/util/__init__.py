@@ -3,6 +3,7 @@
 
 from typing import Union, Tuple, List, Iterator, Dict, Optional, Any
 
+import struct
 import uuid
 
 import gdb
@@ -101,11 +102,25 @@ def struct_has_member(gdbtype: TypeSpecifier, name: str) -> bool:
 
     """
     gdbtype = resolve_type(gdbtype)
-    try:
-        x = offsetof(gdbtype, name) # pylint: disable=unused-variable
-        return True
-    except InvalidComponentError:
-        return False
+    return offsetof(gdbtype, name, False) is not None
+
+# Symbols found by get_symbol_value without a block, by (name, domain)
+_symbol_cache: Dict[Tuple[str, int], gdb.Symbol] = dict()
+
+def _lookup_unscoped_symbol(symname: str, domain: int) -> Optional[gdb.Symbol]:
+    key = (symname, domain)
+    sym = _symbol_cache.get(key)
+    if sym is not None and sym.is_valid():
+        return sym
+
+    # Global symbols are found directly, without the search through
+    # every block that gdb.lookup_symbol does
+    sym = gdb.lookup_global_symbol(symname, domain)
+    if sym is None:
+        sym = gdb.lookup_symbol(symname, None, domain)[0]
+    if sym is not None:
+        _symbol_cache[key] = sym
+    return sym
 
 def get_symbol_value(symname: str, block: gdb.Block = None,
                      domain: int = None) -> gdb.Value:
@@ -115,7 +130,8 @@ def get_symbol_value(symname: str, block: gdb.Block = None,
     Args:
         symname (str): Name of the symbol to resolve
         block (gdb.Block, optional, default=None): The block to resolve
-            the symbol within
+            the symbol within.  Without a block, global symbols are
+            preferred and the symbols found are remembered.
         domain (gdb.Symbol constant SYMBOL_*_DOMAIN, optional, default=None):
             The domain to search for the symbol
     Returns:
@@ -125,7 +141,10 @@ def get_symbol_value(symname: str, block: gdb.Block = None,
     """
     if domain is None:
         domain = gdb.SYMBOL_VAR_DOMAIN
-    sym = gdb.lookup_symbol(symname, block, domain)[0]
+    if block is None:
+        sym = _lookup_unscoped_symbol(symname, domain)
+    else:
+        sym = gdb.lookup_symbol(symname, block, domain)[0]
     if sym:
         return sym.value()
     raise MissingSymbolError("Cannot locate symbol {}".format(symname))
@@ -192,19 +211,24 @@ def __offsetof(val: gdb.Type, spec: str,
         if gdbtype.code != gdb.TYPE_CODE_STRUCT and \
            gdbtype.code != gdb.TYPE_CODE_UNION:
             raise _InvalidComponentTypeError(member, spec)
-        for field in gdbtype.fields():
+        # gdb can find a direct member itself without us walking the fields
+        try:
+            field = gdbtype[member]
             off = field.bitpos >> 3
-            if field.name == member:
-                nexttype = field.type
-                found = True
-                break
+            nexttype = field.type
+            found = True
+        except KeyError:
+            pass
 
+        if not found:
             # Step into anonymous structs and unions
-            if field.name is None:
+            for field in gdbtype.fields():
+                if field.name is not None:
+                    continue
                 res = __offsetof(field.type, member, False)
                 if res is not None:
                     found = True
-                    off += res[0]
+                    off = (field.bitpos >> 3) + res[0]
                     nexttype = res[1]
                     break
         if not found:
@@ -216,6 +240,31 @@ def __offsetof(val: gdb.Type, spec: str,
 
     return (offset, gdbtype)
 
+# offsetof_type results by objfile, type code, type name, size, top-level
+# member names and member spec, with None for members that don't exist.
+# Modules can define different structures with the same tag, and so can
+# different compilation units of the same objfile, so the key identifies
+# the definition rather than just the name.  Loading another objfile can
+# introduce new definitions, so start over then.
+_OffsetofKey = Tuple[gdb.Objfile, int, str, int, Tuple[Optional[str], ...],
+                     str]
+_offsetof_cache: Dict[_OffsetofKey, Optional[Tuple[int, gdb.Type]]] = dict()
+
+def _clear_offsetof_cache(event: Any) -> None:
+    # pylint: disable=unused-argument
+    _offsetof_cache.clear()
+
+gdb.events.new_objfile.connect(_clear_offsetof_cache)
+
+def _offsetof_uncached(gdbtype: gdb.Type, member_name: str,
+                       error: bool) -> Optional[Tuple[int, gdb.Type]]:
+    try:
+        return __offsetof(gdbtype, member_name, error)
+    except _InvalidComponentBaseError as e:
+        if error:
+            raise InvalidComponentError(gdbtype, member_name, str(e)) from e
+        return None
+
 def offsetof_type(gdbtype: gdb.Type, member_name: str,
                   error: bool = True) -> Union[Tuple[int, gdb.Type], None]:
     """
@@ -248,12 +297,28 @@ def offsetof_type(gdbtype: gdb.Type, member_name: str,
        gdbtype.code != gdb.TYPE_CODE_UNION:
         raise NotStructOrUnionError('gdbtype', gdbtype)
 
+    typename = gdbtype.tag or gdbtype.name
+    # gdb.Type.objfile is only available with gdb 9 and later
+    objfile = getattr(gdbtype, 'objfile', None)
+    fields = gdbtype.fields()
+    if typename is None or objfile is None or not fields:
+        # Anonymous types can't be told apart by name, types without an
+        # objfile can't be told apart from those of other modules, and
+        # opaque declarations have nothing worth caching
+        return _offsetof_uncached(gdbtype, member_name, error)
+
+    key = (objfile, gdbtype.code, typename, gdbtype.sizeof,
+           tuple(field.name for field in fields), member_name)
     try:
-        return __offsetof(gdbtype, member_name, error)
-    except _InvalidComponentBaseError as e:
-        if error:
-            raise InvalidComponentError(gdbtype, member_name, str(e)) from e
-        return None
+        res = _offsetof_cache[key]
+    except KeyError:
+        res = _offsetof_uncached(gdbtype, member_name, False)
+        _offsetof_cache[key] = res
+
+    if res is None and error:
+        # Resolve it again to report what went wrong
+        _offsetof_uncached(gdbtype, member_name, True)
+    return res
 
 def offsetof(gdbtype: gdb.Type, member_name: str,
              error: bool = True) -> Union[int, None]:
@@ -355,6 +420,177 @@ def array_size(value: gdb.Value) -> int:
     """
     return value.type.sizeof // value[0].type.sizeof
 
+_byteorder: Optional[str] = None
+
+_int_formats = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
+def target_byteorder() -> str:
+    """
+    Returns the byte order of the target
+
+    Returns:
+        str: ``'<'`` for little endian targets or ``'>'`` for big endian
+            targets, suitable as a :mod:`struct` format prefix
+    """
+    global _byteorder # pylint: disable=global-statement
+    if _byteorder is None:
+        endian = gdb.execute("show endian", to_string=True)
+        if endian is not None and "big endian" in endian:
+            _byteorder = '>'
+        else:
+            _byteorder = '<'
+    return _byteorder
+
+def read_memory(address: int, size: int) -> bytes:
+    """
+    Reads a range of target memory in a single access
+
+    Args:
+        address (int): The address to start reading from
+        size (int): The number of bytes to read
+
+    Returns:
+        bytes: The contents of the memory range
+    """
+    return gdb.selected_inferior().read_memory(address, size).tobytes()
+
+def read_uint_array(address: int, count: int,
+                    size: int = 8) -> Tuple[int, ...]:
+    """
+    Reads an array of unsigned integers in a single memory access
+
+    Args:
+        address (int): The address of the first element
+        count (int): The number of elements to read
+        size (int, optional, default=8): The size of each element in bytes
+
+    Returns:
+        tuple of int: The elements of the array
+
+    Raises:
+        ValueError: size is not 1, 2, 4, or 8
+    """
+    if count <= 0:
+        return tuple()
+    try:
+        fmt = f"{target_byteorder()}{count}{_int_formats[size]}"
+    except KeyError:
+        raise ValueError(f"unsupported integer size {size}") from None
+    return struct.unpack(fmt, read_memory(address, count * size))
+
+def read_int_array(address: int, count: int,
+                   size: int = 8) -> Tuple[int, ...]:
+    """
+    Reads an array of signed integers in a single memory access
+
+    Args:
+        address (int): The address of the first element
+        count (int): The number of elements to read
+        size (int, optional, default=8): The size of each element in bytes
+
+    Returns:
+        tuple of int: The elements of the array
+
+    Raises:
+        ValueError: size is not 1, 2, 4, or 8
+    """
+    if count <= 0:
+        return tuple()
+    try:
+        fmt = f"{target_byteorder()}{count}{_int_formats[size].lower()}"
+    except KeyError:
+        raise ValueError(f"unsupported integer size {size}") from None
+    return struct.unpack(fmt, read_memory(address, count * size))
+
+def _is_signed_int(gdbtype: gdb.Type) -> bool:
+    if gdbtype.code != gdb.TYPE_CODE_INT:
+        return False
+    try:
+        return bool(gdbtype.is_signed)
+    except AttributeError:
+        # gdb.Type.is_signed is only available with gdb 12 and later
+        return int(gdb.Value(-1).cast(gdbtype)) < 0
+
+def _member_bitsize(gdbtype: gdb.Type, spec: str) -> int:
+    gdbtype = gdbtype.strip_typedefs()
+    if gdbtype.code == gdb.TYPE_CODE_PTR:
+        gdbtype = gdbtype.target().strip_typedefs()
+    (member, _, rest) = spec.partition('.')
+    for field in gdbtype.fields():
+        if field.name == member:
+            if rest:
+                return _member_bitsize(field.type, rest)
+            return field.bitsize
+        if field.name is None and offsetof(field.type, member, False) is not None:
+            return _member_bitsize(field.type, spec)
+    return 0
+
+class StructReader:
+    """
+    Reads a fixed set of integer or pointer members of a structure using a
+    single memory access rather than one gdb value lookup per member.
+
+    Args:
+        gdbtype (gdb.Type): The structure type containing the members
+        members (list of str): The names of the members to read.  Members
+            within anonymous structures and unions and nested members
+            (e.g. ``'list.next'``) are resolved as with :func:`offsetof`.
+
+    Attributes:
+        size (int): The number of bytes read for each structure
+
+    Raises:
+        InvalidComponentError: A member could not be resolved
+        TypeError: A member is not an integer or pointer type suitable
+            for unpacking (e.g. a bitfield)
+    """
+    def __init__(self, gdbtype: gdb.Type, members: List[str]) -> None:
+        layout = []
+        for member in members:
+            res = offsetof_type(gdbtype, member)
+            if res is None:
+                raise InvalidComponentError(gdbtype, member, "not found")
+            (offset, membertype) = res
+            membertype = membertype.strip_typedefs()
+            if _member_bitsize(gdbtype, member):
+                raise TypeError(f"member {member} of {gdbtype} is a bitfield")
+            if (membertype.code not in (gdb.TYPE_CODE_INT, gdb.TYPE_CODE_PTR,
+                                        gdb.TYPE_CODE_ENUM,
+                                        gdb.TYPE_CODE_BOOL) or
+                    membertype.sizeof not in _int_formats):
+                raise TypeError(f"member {member} of {gdbtype} cannot be "
+                                "unpacked as an integer")
+            layout.append((offset, membertype.sizeof,
+                           _is_signed_int(membertype)))
+
+        self.members = list(members)
+        self._layout = layout
+        self._unpackers: List[Tuple[int, struct.Struct]] = list()
+        self.size = max([off + size for (off, size, _) in layout], default=0)
+
+    def read(self, address: int) -> Tuple[int, ...]:
+        """
+        Reads the members of the structure at the given address
+
+        Args:
+            address (int): The address of the structure
+
+        Returns:
+            tuple of int: The values of the members, in the order they
+                were requested
+        """
+        if not self._unpackers:
+            order = target_byteorder()
+            self._unpackers = list()
+            for (off, size, signed) in self._layout:
+                fmt = _int_formats[size]
+                if signed:
+                    fmt = fmt.lower()
+                self._unpackers.append((off, struct.Struct(order + fmt)))
+        buf = read_memory(address, self.size)
+        return tuple(unpacker.unpack_from(buf, off)[0]
+                     for (off, unpacker) in self._unpackers)
+
 def get_typed_pointer(val: AddressSpecifier, gdbtype: gdb.Type) -> gdb.Value:
     """
     Returns a pointer to the requested type at the given address
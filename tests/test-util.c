@@ -133,6 +133,16 @@ unsigned long global_array[5] = {
 	0xdeadbef3,
 };
 
+long global_signed_array[3] = { -2, 0, 2 };
+
+struct signed_test {
+	long signed_member;
+	unsigned long unsigned_member;
+} signed_test = {
+	.signed_member = -1,
+	.unsigned_member = -1UL,
+};
+
 /* for container_of */
 unsigned long *long_container = &test_struct.test_member;
 
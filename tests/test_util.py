@@ -10,6 +10,7 @@ from crash.util import get_symbol_value, safe_get_symbol_value
 from crash.exceptions import ArgumentTypeError
 from crash.exceptions import NotStructOrUnionError
 from crash.util import InvalidComponentError
+from crash.util import StructReader, read_uint_array, read_int_array
 
 
 def getsym(sym):
@@ -42,6 +43,12 @@ class TestUtil(unittest.TestCase):
         with self.assertRaises(InvalidComponentError):
             offset = offsetof(self.test_struct, 'invalid_member')
 
+    def test_invalid_member_repeated(self):
+        self.assertTrue(offsetof(self.test_struct, 'invalid_member',
+                                 False) is None)
+        with self.assertRaises(InvalidComponentError):
+            offset = offsetof(self.test_struct, 'invalid_member')
+
     def test_struct_by_symbol(self):
         val = gdb.lookup_global_symbol("global_struct_symbol")
         with self.assertRaises(ArgumentTypeError):
@@ -100,6 +107,12 @@ class TestUtil(unittest.TestCase):
         offset = offsetof(self.test_struct, 'test_member')
         self.assertTrue(offset == 0)
 
+    def test_struct_repeated(self):
+        first = offsetof(self.test_struct, 'named_struct.named_struct_member2')
+        second = offsetof(self.test_struct.pointer(),
+                          'named_struct.named_struct_member2')
+        self.assertTrue(first == second)
+
     def test_struct_pointer(self):
         offset = offsetof(self.test_struct.pointer(), 'test_member')
         self.assertTrue(offset == 0)
@@ -346,6 +359,11 @@ class TestUtil(unittest.TestCase):
         with self.assertRaises(MissingSymbolError):
             sym = get_symbol_value("test_struct_bad")
 
+    def test_get_symbol_value_repeated(self):
+        first = get_symbol_value("test_struct")
+        second = get_symbol_value("test_struct")
+        self.assertTrue(int(first.address) == int(second.address))
+
     def test_safe_get_symbol_value_good(self):
         sym = safe_get_symbol_value("test_struct")
         self.assertTrue(isinstance(sym, gdb.Value))
@@ -599,3 +617,49 @@ class TestUtil(unittest.TestCase):
         self.assertTrue(sym.address != container.address)
         with self.assertRaises(NotStructOrUnionError):
             addr = container_of(sym, self.ulong, 'test_member')
+
+    def test_struct_reader(self):
+        container = getsym('test_struct')
+        reader = StructReader(self.test_struct,
+                              ['test_member', 'anon_struct_member2',
+                               'named_struct.named_struct_member1'])
+        vals = reader.read(int(container.address))
+        self.assertTrue(vals == (0xdeadbe00, 0xdeadbe02, 0xdeadbe07))
+
+    def test_struct_reader_anon_union_embedded(self):
+        container = getsym('test_struct')
+        reader = StructReader(self.test_struct,
+                              ['anon_union_embedded_struct.embedded_member2',
+                               'anon_union_member1'])
+        vals = reader.read(int(container.address))
+        self.assertTrue(vals == (0xdeadbe0E, 0xdeadbe0D))
+
+    def test_struct_reader_signed(self):
+        container = getsym('signed_test')
+        reader = StructReader(gdb.lookup_type('struct signed_test'),
+                              ['signed_member', 'unsigned_member'])
+        vals = reader.read(int(container.address))
+        self.assertTrue(vals == (-1, (1 << (self.ulongsize * 8)) - 1))
+
+    def test_struct_reader_bad_name(self):
+        with self.assertRaises(InvalidComponentError):
+            reader = StructReader(self.test_struct, ['bad_name'])
+
+    def test_struct_reader_not_integer(self):
+        with self.assertRaises(TypeError):
+            reader = StructReader(self.test_struct, ['named_struct'])
+
+    def test_read_uint_array(self):
+        array = getsym('global_array')
+        vals = read_uint_array(int(array.address), 5, self.ulongsize)
+        self.assertTrue(vals == (0xdeadbeef, 0xdeadbef0, 0xdeadbef1,
+                                 0xdeadbef2, 0xdeadbef3))
+
+    def test_read_uint_array_empty(self):
+        array = getsym('global_array')
+        self.assertTrue(read_uint_array(int(array.address), 0) == tuple())
+
+    def test_read_int_array(self):
+        array = getsym('global_signed_array')
+        vals = read_int_array(int(array.address), 3, self.ulongsize)
+        self.assertTrue(vals == (-2, 0, 2))